@@ -3,78 +3,101 @@ import torch
 import pandas as pd
 from torch.utils.data import DataLoader
 import csv
-from sklearn.metrics import accuracy_score
 
-from LSTM import KickBoxingLSTM, KeypointDataset, parse_annotations, STRIKE_TYPES, STRIKE_TYPE_TO_ID
+from LSTM import KickBoxingLSTM, KeypointDataset, parse_annotations, prepare_model_for_inference, STRIKE_TYPES, \
+    STRIKE_TYPE_TO_ID, CSV_WRITE_BUFFER_SIZE, CSV_ENGINE, SEQUENCE_LENGTH, HIDDEN_SIZE, batch_confusion_matrix, \
+    per_strike_accuracies
 
-def load_model(model_path, input_size, hidden_size, num_layers, device):
+def load_model(model_path, input_size, hidden_size, num_layers, device, sequence_length=1, batch_size=1):
+    """
+    Loads a trained model and prepares it for inference.
+    Checkpoints saved by training store their architecture and sequence length, which take precedence over the
+    arguments. Older checkpoints hold only the weights and were trained on single frames, so for those the
+    arguments are used as given. The model is warmed up on batches of batch_size, which should match the loader.
+    Returns:
+        tuple: The model ready for inference and the sequence length it expects.
+    """
+    checkpoint = torch.load(model_path, map_location=device)
+    if 'state_dict' in checkpoint:
+        # Read the architecture and sequence length the model was trained with
+        input_size = checkpoint['input_size']
+        hidden_size = checkpoint['hidden_size']
+        num_layers = checkpoint['num_layers']
+        sequence_length = checkpoint['sequence_length']
+        checkpoint = checkpoint['state_dict']
     # Initialize the LSTM model with specified architecture parameters
     model = KickBoxingLSTM(input_size, hidden_size, num_layers)
     # Load the trained model weights
-    model.load_state_dict(torch.load(model_path, map_location=device))
+    model.load_state_dict(checkpoint)
     # Move model to the specified device (GPU or CPU)
     model.to(device)
-    # Set the model to evaluation mode
-    model.eval()
-    return model
+    # Flatten the LSTM weights again after moving them so cuDNN can use its fused kernel
+    model.lstm.flatten_parameters()
+    # Set the model to evaluation mode and convert it into a frozen TorchScript module optimized for inference
+    return prepare_model_for_inference(model, input_size, device, sequence_length, batch_size), sequence_length
 
-def load_data_and_predict(model_path, csv_file_path, annotations, input_size, hidden_size, num_layers, device):
+def load_data_and_predict(model_path, csv_file_path, annotations, input_size, hidden_size, num_layers, device,
+                          sequence_length=1):
+    batch_size = 10  # The model is warmed up on the same batch size the loader produces
+    # Load the model first, since its checkpoint determines the sequence length the data must be split into
+    model, sequence_length = load_model(model_path, input_size, hidden_size, num_layers, device, sequence_length,
+                                        batch_size)
     # Load CSV file into a DataFrame
-    data_frame = pd.read_csv(csv_file_path)
-    # Create dataset from DataFrame and annotations
-    dataset = KeypointDataset(data_frame, annotations)
+    data_frame = pd.read_csv(csv_file_path, engine=CSV_ENGINE)
+    # Create dataset from DataFrame and annotations, using the same sequence length as in training
+    dataset = KeypointDataset(data_frame, annotations, sequence_length)
     # DataLoader to manage batches of data
-    loader = DataLoader(dataset, batch_size=10, shuffle=False)
-    # Load the model with the specified architecture and device
-    model = load_model(model_path, input_size, hidden_size, num_layers, device)
+    loader = DataLoader(dataset, batch_size=batch_size, shuffle=False)
     # Perform predictions using the model
     predictions, actuals, frames = predict(model, loader, device)
     return predictions, actuals, frames
 
 def predict(model, loader, device):
-    predictions = []
+    # Preallocate the predictions on the device and move them back to the CPU once at the end
+    predictions = torch.empty(len(loader.dataset), dtype=torch.long, device=device)
+    offset = 0
     actual_strikes = []
     frame_numbers = []
     # No gradient needed for prediction, only inference
-    with torch.no_grad():
+    with torch.inference_mode():
         for data in loader:
-            keypoints = data['keypoints'].to(device)
+            keypoints = data['keypoints'].to(device, non_blocking=True)
             labels = data['labels'].cpu().numpy()
             frames = data['Frame Number']
             # Forward pass to get outputs from the model
             outputs = model(keypoints)
             # Select the class with the highest probability
-            _, preds = torch.max(outputs, 1)
+            preds = outputs.argmax(1)
             # Collect predictions, actual labels, and frame numbers
-            predictions.extend(preds.cpu().numpy())
+            predictions[offset:offset + preds.size(0)] = preds
+            offset += preds.size(0)
             actual_strikes.extend(labels)
             frame_numbers.extend(frames)
-    return predictions, actual_strikes, frame_numbers
+    # Only the filled part of the buffer holds predictions if the loader skipped samples
+    return predictions[:offset].cpu().tolist(), actual_strikes, frame_numbers
 
 def evaluate_accuracy_per_strike_type(predictions, actual_strikes):
-    accuracies = {}
+    # Convert the predictions and labels to tensors once and count every (actual, predicted) pair in one pass
+    actual_tensor = torch.from_numpy(np.asarray(actual_strikes, dtype=np.int64))
+    pred_tensor = torch.from_numpy(np.asarray(predictions, dtype=np.int64))
     # Calculate accuracy for each strike type individually
-    for strike_id, strike_name in enumerate(STRIKE_TYPES):
-        actual_array = (np.array(actual_strikes) == strike_id)
-        pred_array = (np.array(predictions) == strike_id)
-        # Only calculate accuracy if there are actual instances of the strike type
-        if actual_array.any():
-            accuracy = accuracy_score(actual_array, pred_array)
-            accuracies[strike_name] = accuracy
-    return accuracies
+    return per_strike_accuracies(batch_confusion_matrix(actual_tensor, pred_tensor))
 
 def save_predictions_to_csv(predictions, actual_strikes, frames, csv_output_path):
-    # Open CSV file for writing predictions
-    with open(csv_output_path, 'w', newline='') as csvfile:
+    # Build each row with the corresponding frame number and strike types
+    rows = [(frame, STRIKE_TYPES[pred], STRIKE_TYPES[actual])
+            for frame, pred, actual in zip(frames, predictions, actual_strikes)]
+    # Open CSV file for writing predictions and write all rows at once
+    with open(csv_output_path, 'w', newline='', buffering=CSV_WRITE_BUFFER_SIZE) as csvfile:
         writer = csv.writer(csvfile)
         writer.writerow(['Frame Number', 'Predicted Strike', 'Actual Strike'])
-        # Write each prediction with the corresponding frame number and strike type
-        for frame, pred, actual in zip(frames, predictions, actual_strikes):
-            writer.writerow([frame, STRIKE_TYPES[pred], STRIKE_TYPES[actual]])
+        writer.writerows(rows)
 
 if __name__ == '__main__':
     # Setup the device (GPU or CPU) for model computations
     device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
+    # Input shapes are fixed, so let cuDNN benchmark and pick the fastest kernels
+    torch.backends.cudnn.benchmark = True
     # Specify paths for the model, CSV input, annotations, and CSV output
     model_path = 'C:/Users/12.99 a pillow/PycharmProjects/CS482FinalProject/Model/model_fold_5_epoch_50.pth'
     csv_file = 'C:/Users/12.99 a pillow/PycharmProjects/CS482FinalProject/Test/GloryRingTest.csv'
@@ -86,7 +109,7 @@ if __name__ == '__main__':
 
     # Load data, perform predictions, and save them
     predictions, actual_strikes, frames = load_data_and_predict(
-        model_path, csv_file, annotations_dict, 51, 128, 2, device
+        model_path, csv_file, annotations_dict, 51, HIDDEN_SIZE, 2, device, SEQUENCE_LENGTH
     )
     save_predictions_to_csv(predictions, actual_strikes, frames, csv_output_path)
 
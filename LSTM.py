@@ -1,25 +1,37 @@
+import copy
 import csv
-from sklearn.metrics import accuracy_score, precision_score, recall_score, f1_score, confusion_matrix
 from sklearn.model_selection import KFold
 from sklearn.preprocessing import StandardScaler
 import xml.etree.ElementTree as ET
 import os
+import pickle
+import tempfile
 import numpy as np
 import torch
 import torch.nn as nn
 from torch.nn import CrossEntropyLoss
 from torch.optim import Adam
-from torch.utils.data import DataLoader, Dataset
+from torch.utils.data import ConcatDataset, DataLoader, Dataset, Subset
 import pandas as pd
 import warnings
 from sklearn.exceptions import DataConversionWarning
 
 warnings.filterwarnings("ignore", message="X does not have valid feature names")
 
+# Parse CSV files with pyarrow's multithreaded reader when it is installed, otherwise fall back to pandas' C parser
+try:
+    import pyarrow  # noqa: F401
+    CSV_ENGINE = 'pyarrow'
+except ImportError:
+    CSV_ENGINE = 'c'
+
 # Constant Values
 STRIKE_TYPES = ['No Strike', 'Jab', 'Cross', 'Hook', 'Upper', 'Leg Kick', 'Body Kick', 'High Kick']
 NUM_CLASSES = len(STRIKE_TYPES)
 STRIKE_TYPE_TO_ID = {name: i for i, name in enumerate(STRIKE_TYPES)}
+CSV_WRITE_BUFFER_SIZE = 1 << 20  # Buffer size in bytes used when writing result CSV files
+SEQUENCE_LENGTH = 10  # Number of consecutive frames of one person fed to the LSTM as one sequence
+HIDDEN_SIZE = 128  # Number of features in the LSTM hidden state
 
 
 class EarlyStopping:
@@ -63,6 +75,81 @@ class EarlyStopping:
                 self.early_stop = True
 
 
+class DataPrefetcher:
+    """
+    Wraps a DataLoader and copies the next batch to the GPU on a dedicated CUDA stream while the current batch is
+    being processed, so host-to-device transfers overlap with model compute.
+    The wrapped DataLoader should use pin_memory=True, otherwise the copies cannot run asynchronously.
+    On a CPU device the batches are simply moved to the device without a side stream.
+    """
+
+    def __init__(self, loader, device):
+        """
+        Initializes the prefetcher and starts loading the first batch.
+        Parameters:
+            loader (DataLoader): The DataLoader providing dictionaries with 'keypoints' and 'labels'.
+            device (torch.device): The device the batches should be moved to.
+        """
+        # Iterator over the wrapped DataLoader
+        self.loader = iter(loader)
+        self.device = device
+        # Side stream used for the copies; only available when running on a GPU
+        self.stream = torch.cuda.Stream() if device.type == 'cuda' else None
+        # The batch that will be returned by the next call to __next__
+        self.next_keypoints = None
+        self.next_labels = None
+        self.preload()
+
+    def preload(self):
+        """
+        Fetches the next batch from the DataLoader and starts copying it to the device.
+        """
+        try:
+            batch = next(self.loader)
+        except StopIteration:
+            # Mark the end of the data so __next__ can stop the iteration
+            self.next_keypoints = None
+            self.next_labels = None
+            return
+
+        if self.stream is None:
+            self.next_keypoints = batch['keypoints'].to(self.device)
+            self.next_labels = batch['labels'].to(self.device)
+            return
+
+        # Issue the copies on the side stream so they run concurrently with the current step
+        with torch.cuda.stream(self.stream):
+            self.next_keypoints = batch['keypoints'].to(self.device, non_blocking=True)
+            self.next_labels = batch['labels'].to(self.device, non_blocking=True)
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        """
+        Returns the prefetched batch and starts copying the following one.
+        Returns:
+            tuple: The keypoints and labels tensors of the current batch, already on the device.
+        """
+        if self.stream is not None:
+            # Make the compute stream wait until the copies of the prefetched batch have finished
+            torch.cuda.current_stream().wait_stream(self.stream)
+
+        keypoints = self.next_keypoints
+        labels = self.next_labels
+        if keypoints is None:
+            raise StopIteration
+
+        if self.stream is not None:
+            # Tell the caching allocator these tensors are used on the compute stream so their memory
+            # is not reused by the side stream too early; record_stream works in place and returns None
+            keypoints.record_stream(torch.cuda.current_stream())
+            labels.record_stream(torch.cuda.current_stream())
+
+        self.preload()
+        return keypoints, labels
+
+
 class ValidationKeypointDataset(Dataset):
     def __init__(self, csv_file, annotations):
         """
@@ -71,22 +158,32 @@ class ValidationKeypointDataset(Dataset):
             csv_file (str): Path to the CSV file containing the keypoints data.
             annotations (dict): Dictionary mapping frame numbers to strike labels.
         """
-        # Load data from the specified CSV file
-        self.data_frame = pd.read_csv(csv_file)
+        # Load data from the specified CSV file; only the arrays built from it are kept on the dataset
+        data_frame = pd.read_csv(csv_file, engine=CSV_ENGINE)
         # Store the annotations dictionary which maps frame numbers to strike types
         self.annotations = annotations
         # Extract the names of columns that contain 'keypoint' in their header for filtering keypoint data
-        self.keypoint_columns = [col for col in self.data_frame.columns if 'keypoint' in col]
+        self.keypoint_columns = [col for col in data_frame.columns if 'keypoint' in col]
 
         # Verify that the CSV contains all required keypoint columns
-        if not set(self.keypoint_columns).issubset(set(self.data_frame.columns)):
+        if not set(self.keypoint_columns).issubset(set(data_frame.columns)):
             raise ValueError("CSV file does not contain all required keypoint columns.")
 
+        # Convert all keypoints into one contiguous float32 tensor so samples are plain tensor slices
+        keypoints = data_frame[self.keypoint_columns].to_numpy(dtype=np.float32, copy=True)
+        self.kp_tensor = torch.from_numpy(keypoints)
+        # Keep the frame numbers and actual strikes as arrays instead of looking them up row by row
+        self.frame_numbers = data_frame['Frame Number'].to_numpy()
+        self.actual_strikes = data_frame['Actual Strike'].to_numpy()
+        # Map every frame number to its label once, defaulting to 'No Strike' if not found
+        self.labels = torch.tensor([self.annotations.get(int(frame), STRIKE_TYPE_TO_ID['No Strike'])
+                                    for frame in self.frame_numbers], dtype=torch.long)
+
     def __len__(self):
         """
         Returns the number of samples in the dataset.
         """
-        return len(self.data_frame)
+        return len(self.kp_tensor)
 
     def __getitem__(self, idx):
         """
@@ -96,20 +193,9 @@ class ValidationKeypointDataset(Dataset):
         Returns:
             dict: A dictionary containing the keypoints, label, frame number, and actual strike information.
         """
-        # Access the row corresponding to the index from the dataframe
-        row = self.data_frame.iloc[idx]
-        # Extract keypoints from the row and convert to a 1D numpy float32 array
-        keypoints = row[self.keypoint_columns].values.astype(np.float32).reshape(-1)
-        # Retrieve the frame number from the row
-        frame_number = row['Frame Number']
-        # Retrieve the actual strike value from the row
-        actual_strike = row['Actual Strike']
-        # Determine the label for the frame using the annotations dictionary, default to 'No Strike' if not found
-        label = self.annotations.get(frame_number, STRIKE_TYPE_TO_ID['No Strike'])
-        # Convert keypoints to a Torch tensor
-        keypoints = torch.from_numpy(keypoints)
-        # Return the sample as a dictionary
-        return {'keypoints': keypoints, 'labels': label, 'frame_number': frame_number, 'actual_strike': actual_strike}
+        # Keypoints are returned as a sequence of length 1, shape (1, features), as expected by the LSTM
+        return {'keypoints': self.kp_tensor[idx].unsqueeze(0), 'labels': self.labels[idx].item(),
+                'frame_number': self.frame_numbers[idx], 'actual_strike': self.actual_strikes[idx]}
 
 
 class ValidationComparisonDataset(Dataset):
@@ -124,19 +210,28 @@ class ValidationComparisonDataset(Dataset):
         Parameters:
             csv_file (str): The path to the CSV file containing the data.
         """
-        # Load data from the specified CSV file
-        self.data_frame = pd.read_csv(csv_file)
+        # Load data from the specified CSV file; only the arrays built from it are kept
+        data_frame = pd.read_csv(csv_file, engine=CSV_ENGINE)
 
         # Check if the required columns are present in the DataFrame
         required_columns = {'Frame Number', 'Predicted Strike', 'Actual Strike'}
-        if not required_columns.issubset(self.data_frame.columns):
+        if not required_columns.issubset(data_frame.columns):
             raise ValueError("CSV file does not contain all required columns: " + str(required_columns))
 
+        # Map the strike names to their IDs for the whole columns at once instead of per item
+        predicted_ids = data_frame['Predicted Strike'].map(STRIKE_TYPE_TO_ID)
+        actual_ids = data_frame['Actual Strike'].map(STRIKE_TYPE_TO_ID)
+        if predicted_ids.isna().any() or actual_ids.isna().any():
+            raise ValueError("CSV file contains strike types that are not in STRIKE_TYPES: " + str(STRIKE_TYPES))
+        self.pred_ids = predicted_ids.to_numpy(dtype=np.int64)
+        self.actual_ids = actual_ids.to_numpy(dtype=np.int64)
+        self.frames = data_frame['Frame Number'].to_numpy()
+
     def __len__(self):
         """
         Returns the total number of entries in the dataset.
         """
-        return len(self.data_frame)
+        return len(self.frames)
 
     def __getitem__(self, idx):
         """
@@ -146,15 +241,11 @@ class ValidationComparisonDataset(Dataset):
         Returns:
             dict: A dictionary containing the frame number, predicted strike, and actual strike.
         """
-        # Access the data row corresponding to the index
-        row = self.data_frame.iloc[idx]
-
-        # Extract data from the row and map strike types from string to a predefined ID
-        # Ensure that STRIKE_TYPE_TO_ID is defined elsewhere in your code to map strike names to their respective IDs
+        # Index the precomputed arrays; the strike types were already mapped to their IDs in __init__
         return {
-            'frame_number': row['Frame Number'],
-            'predicted_strike': STRIKE_TYPE_TO_ID[row['Predicted Strike']],
-            'actual_strike': STRIKE_TYPE_TO_ID[row['Actual Strike']]
+            'frame_number': self.frames[idx],
+            'predicted_strike': self.pred_ids[idx],
+            'actual_strike': self.actual_ids[idx]
         }
 
 
@@ -173,8 +264,13 @@ def validate_without_inference(validation_loader):
     Returns:
         float: The accuracy of the predictions as the ratio of correct predictions to the total predictions.
     """
-    # Initialize counters for correct predictions and total samples
-    correct = 0
+    # A ValidationComparisonDataset already holds all predicted and actual strike IDs, so compare them in one pass
+    if isinstance(validation_loader.dataset, ValidationComparisonDataset):
+        dataset = validation_loader.dataset
+        return float((dataset.pred_ids == dataset.actual_ids).mean())
+
+    # Initialize counters for correct predictions and total samples; the correct count stays a tensor until the end
+    correct = torch.zeros((), dtype=torch.long)
     total = 0
 
     # Loop over each batch provided by the validation loader
@@ -184,13 +280,13 @@ def validate_without_inference(validation_loader):
         actual_strikes = data['actual_strike']  # These should be tensors of actual strike IDs
 
         # Calculate the number of correct predictions in the current batch and add to the total correct
-        correct += (predicted_strikes == actual_strikes).sum().item()  # Convert to int and sum
+        correct += (predicted_strikes == actual_strikes).sum()
 
         # Update the total number of predictions processed
         total += predicted_strikes.size(0)  # Count the total predictions in this batch
 
     # Calculate and return the overall accuracy as the ratio of correct predictions to total predictions
-    return correct / total
+    return correct.item() / total
 
 
 class KeypointDataset(Dataset):
@@ -199,27 +295,67 @@ class KeypointDataset(Dataset):
     This dataset includes preprocessing steps like normalization of keypoints using StandardScaler.
     """
 
-    def __init__(self, data_frame, annotations):
+    def __init__(self, data_frame, annotations, sequence_length=1):
         """
         Initializes the KeypointDataset with a pandas DataFrame and annotations.
 
         Parameters:
             data_frame (DataFrame): The DataFrame containing keypoint data along with other relevant information.
             annotations (dict): A dictionary mapping frame IDs to labels (e.g., different types of strikes).
+            sequence_length (int): The number of consecutive frames of one person fed to the LSTM as one sequence.
+                                   Each sequence is labelled by its last frame.
         """
-        self.data_frame = data_frame  # Pandas DataFrame containing the keypoints and other data
+        if sequence_length < 1:
+            raise ValueError("sequence_length must be at least 1.")
+
+        # Sort the rows by person and then by frame so each person's frames are consecutive rows; only the arrays
+        # built from the DataFrame are kept on the dataset, so DataLoader workers do not have to receive a copy of it
+        data_frame = data_frame.sort_values(['person_id', 'frame_id'], kind='mergesort')
         self.annotations = annotations  # Dictionary for mapping frame IDs to annotated labels
+        self.sequence_length = sequence_length  # Number of frames in each sequence
         self.scaler = StandardScaler()  # Initialize a scaler to normalize the keypoint data
         # Identify all columns in the DataFrame that include 'keypoint' in their column name
-        self.keypoint_columns = [col for col in self.data_frame.columns if 'keypoint' in col]
-        # Fit the scaler on the keypoint data converted to float32 for consistency
-        self.scaler.fit(self.data_frame[self.keypoint_columns].astype(np.float32))
+        self.keypoint_columns = [col for col in data_frame.columns if 'keypoint' in col]
+        # Convert the keypoint columns once into a contiguous float32 array, kept raw so the scaler can be refitted
+        self.keypoints = data_frame[self.keypoint_columns].to_numpy(dtype=np.float32, copy=True)
+        # Fit the scaler on the keypoint data and normalize every row up front
+        self.scaler.fit(self.keypoints)
+        self.kp_tensor = torch.from_numpy(self.scaler.transform(self.keypoints).astype(np.float32))
+
+        # View every run of `sequence_length` consecutive rows as a window without copying,
+        # shape (num_rows - sequence_length + 1, sequence_length, features)
+        num_windows = max(len(self.kp_tensor) - sequence_length + 1, 0)
+        num_features = self.kp_tensor.size(1)
+        self.windows = self.kp_tensor.as_strided((num_windows, sequence_length, num_features),
+                                                 (num_features, num_features, 1))
+
+        # Retrieve the person and frame IDs as integers; ensure your data frame includes them or adjust accordingly
+        person_ids = data_frame['person_id'].to_numpy(dtype=np.int64)
+        frame_ids = data_frame['frame_id'].to_numpy(dtype=np.int64)
+        # A row continues the previous one if it belongs to the same person and is the next frame
+        continues = np.zeros(len(frame_ids), dtype=np.int64)
+        continues[1:] = (person_ids[1:] == person_ids[:-1]) & (frame_ids[1:] == frame_ids[:-1] + 1)
+        continues_count = np.concatenate([[0], np.cumsum(continues)])
+        # A window is valid only if every row in it continues the one before, i.e. it never crosses a person or a gap
+        starts = np.arange(num_windows)
+        ends = starts + sequence_length - 1
+        valid = continues_count[ends + 1] - continues_count[starts + 1] == sequence_length - 1
+        starts, ends = starts[valid], ends[valid]
+        # Order the windows by their last frame and then by person, so they follow the order of the video
+        order = np.lexsort((person_ids[ends], frame_ids[ends]))
+        # First row of each window in kp_tensor
+        self.window_starts = starts[order]
+        # Each window takes the frame ID of its last row
+        self.frame_ids = frame_ids[ends[order]]
+        # Map every frame ID to its label using the annotations dictionary, defaulting to 'No Strike' if not found
+        self.labels = torch.tensor([self.annotations.get(int(frame_id), STRIKE_TYPE_TO_ID['No Strike'])
+                                    for frame_id in self.frame_ids], dtype=torch.long)
 
     def __len__(self):
         """
         Returns the total number of entries in the dataset.
         """
-        return len(self.data_frame)
+        return len(self.window_starts)
 
     def __getitem__(self, idx):
         """
@@ -229,20 +365,27 @@ class KeypointDataset(Dataset):
             idx (int): The index of the item to retrieve.
 
         Returns:
-            dict: A dictionary containing the normalized keypoints as a tensor, the label as a tensor,
+            dict: A dictionary containing the normalized keypoint sequence as a tensor, the label as a tensor,
                   and the frame number.
         """
-        # Access the data row corresponding to the index
-        row = self.data_frame.iloc[idx]
-        # Extract keypoints from the row, transform them using the fitted scaler, and select the first element (transform returns a list)
-        keypoints = self.scaler.transform([row[self.keypoint_columns].values.astype(np.float32)])[0]
-        # Retrieve the frame ID from the row, converting it to an integer
-        frame_id = int(row['frame_id'])  # Ensure your data frame includes 'frame_id' or adjust accordingly
-        # Retrieve the label for the frame using the annotations dictionary, defaulting to 'No Strike' if not found
-        label = self.annotations.get(frame_id, STRIKE_TYPE_TO_ID['No Strike'])
-        # Return the keypoints as a float tensor, the label as a long tensor, and the frame number
-        return {'keypoints': torch.from_numpy(keypoints).float(), 'labels': torch.tensor(label, dtype=torch.long),
-                'Frame Number': frame_id}
+        # Slice the precomputed window and label tensors instead of going through the DataFrame
+        return {'keypoints': self.windows[self.window_starts[idx]], 'labels': self.labels[idx],
+                'Frame Number': int(self.frame_ids[idx])}
+
+    def fit_scaler(self, indices):
+        """
+        Refits the scaler on the rows covered by the given windows and normalizes all keypoints with it.
+        During cross-validation this keeps the validation frames out of the normalization.
+
+        Parameters:
+            indices (array-like): Indices of the windows whose rows the scaler is fitted on.
+        """
+        # Collect every row that belongs to at least one of the given windows
+        starts = self.window_starts[np.asarray(indices, dtype=np.int64)]
+        rows = np.unique((starts[:, None] + np.arange(self.sequence_length)).ravel())
+        self.scaler.fit(self.keypoints[rows])
+        # Overwrite the normalized keypoints in place so the window view keeps pointing at them
+        self.kp_tensor.copy_(torch.from_numpy(self.scaler.transform(self.keypoints).astype(np.float32)))
 
 
 class KickBoxingLSTM(nn.Module):
@@ -260,6 +403,8 @@ class KickBoxingLSTM(nn.Module):
         # Define the LSTM layer with specified input size, hidden size, and number of layers
         # `batch_first=True` indicates that the input tensors will have a shape (batch, seq, feature)
         self.lstm = nn.LSTM(input_size, hidden_size, num_layers, batch_first=True, dropout=dropout_rate)
+        # Keep the LSTM weights in one contiguous buffer so cuDNN can use its fused kernel
+        self.lstm.flatten_parameters()
         # Define a fully connected layer to map the LSTM output to the number of classes
         self.fc = nn.Linear(hidden_size, NUM_CLASSES)
         # Dropout layer to prevent overfitting
@@ -275,20 +420,71 @@ class KickBoxingLSTM(nn.Module):
         """
         # Convert input to float32
         x = x.float()
-        # Ensure input tensor is 3D (batch, 1, input_size) if currently 2D
-        if x.dim() == 2:
-            x = x.unsqueeze(1)
-            # Initialize hidden state and cell state with zeros
-        h0 = torch.zeros(self.lstm.num_layers, x.size(0), self.lstm.hidden_size, dtype=torch.float32).to(x.device)
-        c0 = torch.zeros(self.lstm.num_layers, x.size(0), self.lstm.hidden_size, dtype=torch.float32).to(x.device)
-        # Forward pass through LSTM layer
-        out, _ = self.lstm(x, (h0, c0))
+        # Forward pass through LSTM layer; the hidden state and cell state default to zeros
+        out, _ = self.lstm(x)
         # Apply dropout on the outputs of the LSTM
         out = self.dropout(out)
         # Apply the fully connected layer on the last time step output
         return self.fc(out[:, -1, :])
 
 
+def compile_for_training(model, input_size, device, sequence_length=1):
+    """
+    Compiles the model with torch.compile to fuse the dropout and fully connected layer and cut per-step Python
+    overhead. Compilation is only attempted on the GPU with PyTorch 2.0 or newer; the CPU backend needs a C++
+    toolchain and older versions on Windows do not support it. Because torch.compile only compiles on the first
+    call, a trial forward pass is run here so any failure falls back to the eager model instead of stopping training.
+
+    Parameters:
+        model (torch.nn.Module): The model to compile.
+        input_size (int): The number of input features of the model.
+        device (torch.device): The device on which the model will be trained.
+        sequence_length (int): The length of the keypoint sequences the model will be given.
+
+    Returns:
+        torch.nn.Module: The compiled model, or the model itself if it cannot be compiled.
+    """
+    if device.type != 'cuda' or not hasattr(torch, 'compile'):
+        return model
+    try:
+        compiled_model = torch.compile(model, mode='reduce-overhead')
+        with torch.no_grad():
+            compiled_model(torch.zeros(1, sequence_length, input_size, device=device))
+    except Exception as error:
+        warnings.warn(f"torch.compile failed, training the model without compilation: {error}")
+        return model
+    return compiled_model
+
+
+def prepare_model_for_inference(model, input_size, device, sequence_length=1, batch_size=1):
+    """
+    Converts a trained model into a frozen TorchScript module optimized for inference on a fixed input shape.
+    Freezing folds the parameters into the graph and turns the eval-mode dropout into a no-op, so the
+    validation and prediction functions can use the returned module in place of the original model.
+
+    Parameters:
+        model (torch.nn.Module): The trained model to optimize.
+        input_size (int): The number of input features of the model.
+        device (torch.device): The device on which the model will be run.
+        sequence_length (int): The length of the keypoint sequences the model will be given.
+        batch_size (int): The batch size of the loader the model will be given, so the warm-up uses the same shape.
+
+    Returns:
+        torch.jit.ScriptModule: The frozen and optimized module.
+    """
+    # Script the model in evaluation mode and freeze it before applying the inference optimizations
+    scripted = torch.jit.freeze(torch.jit.script(model.eval()))
+    scripted = torch.jit.optimize_for_inference(scripted)
+
+    # The first calls specialize the graph for the input shape and are slow, so run them once up front
+    example_input = torch.zeros(batch_size, sequence_length, input_size, device=device)
+    with torch.inference_mode():
+        for _ in range(2):
+            scripted(example_input)
+
+    return scripted
+
+
 def parse_annotations(xml_file):
     """
     Parses an XML file containing annotations for frames, typically used in datasets for image or video processing tasks.
@@ -296,6 +492,7 @@ def parse_annotations(xml_file):
     The XML structure is expected to have multiple 'track' elements, each representing a sequence of frames
     with a specific label (e.g., different types of actions or strikes). Each 'track' contains multiple 'box'
     elements, each of which corresponds to a frame.
+    The parsed frame labels are cached in a pickle file next to the XML file and reused until the XML file changes.
 
     Parameters:
         xml_file (str): Path to the XML file containing frame annotations.
@@ -303,26 +500,68 @@ def parse_annotations(xml_file):
     Returns:
         dict: A dictionary mapping frame IDs to their corresponding labels, converted to numeric IDs.
     """
-    # Parse the XML file
-    tree = ET.parse(xml_file)
-    # Get the root of the XML tree
-    root = tree.getroot()
-
-    # Initialize a dictionary to store annotations
-    annotations = {}
+    # Reuse the cached frame labels if they were saved after the XML file was last modified; the cache holds the
+    # label names rather than IDs, so changes to STRIKE_TYPES never reuse stale IDs
+    cache_file = xml_file + '.labels.pkl'
+    frame_labels = None
+    if os.path.exists(cache_file) and os.path.getmtime(cache_file) >= os.path.getmtime(xml_file):
+        try:
+            with open(cache_file, 'rb') as file:
+                frame_labels = pickle.load(file)
+        except (OSError, EOFError, pickle.UnpicklingError):
+            # A damaged or unreadable cache is treated as missing and rebuilt below
+            frame_labels = None
+
+    if frame_labels is None:
+        frame_labels = parse_frame_labels(xml_file)
+        # Write the cache to a temporary file first and move it into place, so an interrupted write never leaves
+        # a truncated cache behind; failing to write the cache is not an error
+        temp_file = None
+        try:
+            file_descriptor, temp_file = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(xml_file)),
+                                                          suffix='.tmp')
+            with os.fdopen(file_descriptor, 'wb') as file:
+                pickle.dump(frame_labels, file)
+            os.replace(temp_file, cache_file)
+        except OSError:
+            if temp_file is not None and os.path.exists(temp_file):
+                os.remove(temp_file)
+
+    # Map each frame's label to its numeric ID using a predefined dictionary, defaulting to 'No Strike'
+    return {frame_id: STRIKE_TYPE_TO_ID.get(label, STRIKE_TYPE_TO_ID['No Strike'])
+            for frame_id, label in frame_labels.items()}
+
+
+def parse_frame_labels(xml_file):
+    """
+    Streams through an annotation XML file and collects the label of the track each annotated frame belongs to.
 
-    # Iterate over each 'track' element in the XML
-    for track in root.findall('.//track'):
-        # Get the label for the current track
-        label = track.get('label')
-        # Extract frame IDs from all 'box' elements within the track
-        frame_ids = [int(box.get('frame')) for box in track.findall('.//box')]
-        # Map each frame ID to its corresponding label, using a predefined dictionary to convert labels to numeric IDs
-        for frame_id in frame_ids:
-            annotations[frame_id] = STRIKE_TYPE_TO_ID.get(label, STRIKE_TYPE_TO_ID['No Strike'])
+    Parameters:
+        xml_file (str): Path to the XML file containing frame annotations.
 
-    # Return the dictionary containing the mapped frame IDs and their corresponding labels
-    return annotations
+    Returns:
+        dict: A dictionary mapping frame IDs to the label names of their tracks.
+    """
+    # Initialize a dictionary to store the label of each frame
+    frame_labels = {}
+    # Label of the 'track' element currently being parsed
+    label = None
+
+    # Stream through the XML file so elements can be discarded as soon as they have been processed
+    for event, elem in ET.iterparse(xml_file, events=('start', 'end')):
+        if event == 'start':
+            # Get the label for the track that is starting
+            if elem.tag == 'track':
+                label = elem.get('label')
+        elif elem.tag == 'box' and label is not None:
+            # Map the box's frame ID to the track label
+            frame_labels[int(elem.get('frame'))] = label
+        elif elem.tag == 'track':
+            # The track is finished, so free its boxes to keep memory usage low
+            label = None
+            elem.clear()
+
+    return frame_labels
 
 
 def validate_model(model, validation_loader, device):
@@ -344,117 +583,271 @@ def validate_model(model, validation_loader, device):
     # Set the model to evaluation mode. This changes the behavior of some layers like BatchNorm and Dropout.
     model.eval()
 
-    # Lists to store true and predicted labels for calculating metrics
-    y_true, y_pred = [], []
+    # Confusion matrix accumulated on the device; rows are actual labels and columns are predictions
+    conf_matrix = torch.zeros(NUM_CLASSES, NUM_CLASSES, dtype=torch.long, device=device)
 
     # Ensure no gradients are computed to save memory and computations
-    with torch.no_grad():
+    with torch.inference_mode():
         for data in validation_loader:
             # Transfer keypoints and labels to the specified device
-            keypoints = data['keypoints'].to(device)
-            labels = data['labels'].to(device)
+            keypoints = data['keypoints'].to(device, non_blocking=True)
+            labels = data['labels'].to(device, non_blocking=True)
 
             # Generate model predictions
             outputs = model(keypoints)
             # Extract the class with the highest probability
-            _, predicted = torch.max(outputs.data, 1)
+            predicted = outputs.argmax(1)
 
-            # Append predictions and actual labels to lists, transferring them back to CPU
-            y_pred.extend(predicted.cpu().numpy())
-            y_true.extend(labels.cpu().numpy())
+            # Add the batch to the confusion matrix without transferring anything back to the CPU
+            conf_matrix += batch_confusion_matrix(labels, predicted)
 
-    # Calculate accuracy, precision, recall, F1 score, and confusion matrix using scikit-learn
-    accuracy = accuracy_score(y_true, y_pred)
-    precision = precision_score(y_true, y_pred, average='macro', zero_division=0)
-    recall = recall_score(y_true, y_pred, average='macro', zero_division=0)
-    f1 = f1_score(y_true, y_pred, average='macro', zero_division=0)
-    conf_matrix = confusion_matrix(y_true, y_pred)
+    # Transfer the confusion matrix back to the CPU once and derive the remaining metrics from it
+    conf_matrix = conf_matrix.cpu()
+    accuracy, precision, recall, f1 = confusion_matrix_metrics(conf_matrix)
 
     # Return all metrics
-    return accuracy, precision, recall, f1, conf_matrix
+    return accuracy, precision, recall, f1, conf_matrix.numpy()
+
+
+def batch_confusion_matrix(labels, predictions):
+    """
+    Counts every (actual, predicted) pair of a batch in a single bincount on the device the tensors are on.
+
+    Parameters:
+        labels (Tensor): The actual class IDs as a 1-D integer tensor.
+        predictions (Tensor): The predicted class IDs as a 1-D integer tensor of the same length.
+
+    Returns:
+        Tensor: A (NUM_CLASSES, NUM_CLASSES) tensor whose rows are the actual labels and whose columns are the
+                predictions.
+    """
+    return torch.bincount(NUM_CLASSES * labels + predictions,
+                          minlength=NUM_CLASSES * NUM_CLASSES).view(NUM_CLASSES, NUM_CLASSES)
+
+
+def confusion_matrix_metrics(conf_matrix):
+    """
+    Computes the accuracy and the macro-averaged precision, recall, and F1 score from a confusion matrix.
+    As with scikit-learn's zero_division=0, only classes that appear in the labels or the predictions are averaged.
+
+    Parameters:
+        conf_matrix (Tensor): A (NUM_CLASSES, NUM_CLASSES) tensor whose rows are the actual labels and whose
+                              columns are the predictions.
+
+    Returns:
+        tuple: A tuple containing the accuracy, precision, recall, and F1 score as floats.
+    """
+    conf_matrix = conf_matrix.double()
+    # Correct predictions per class, and the number of times each class was predicted or actually present
+    true_positives = conf_matrix.diag()
+    predicted_counts = conf_matrix.sum(0)
+    actual_counts = conf_matrix.sum(1)
+
+    # Per-class scores, treating divisions by zero as zero
+    precision = true_positives / predicted_counts.clamp(min=1)
+    recall = true_positives / actual_counts.clamp(min=1)
+    f1 = 2 * precision * recall / (precision + recall).clamp(min=1e-9)
+
+    # Average only over the classes that were seen at all
+    present = (predicted_counts + actual_counts) > 0
+    accuracy = (true_positives.sum() / conf_matrix.sum().clamp(min=1)).item()
+    return accuracy, precision[present].mean().item(), recall[present].mean().item(), f1[present].mean().item()
+
+
+def per_strike_accuracies(conf_matrix):
+    """
+    Computes the one-vs-rest accuracy of every strike type that appears in the actual labels of a confusion matrix.
+
+    Parameters:
+        conf_matrix (Tensor): A (NUM_CLASSES, NUM_CLASSES) tensor whose rows are the actual labels and whose
+                              columns are the predictions.
+
+    Returns:
+        dict: A dictionary where the keys are the names of the strikes and the values are their accuracy scores.
+    """
+    total = conf_matrix.sum().item()
+    true_positives = conf_matrix.diag()
+    actual_counts = conf_matrix.sum(1)
+    predicted_counts = conf_matrix.sum(0)
+
+    accuracies = {}
+    for idx, strike in enumerate(STRIKE_TYPES):
+        # Only calculate accuracy if there are instances of this strike type in the true labels
+        if actual_counts[idx] > 0:
+            # One-vs-rest accuracy: every sample except the false positives and false negatives of this strike type
+            false_positives = (predicted_counts[idx] - true_positives[idx]).item()
+            false_negatives = (actual_counts[idx] - true_positives[idx]).item()
+            accuracies[strike] = (total - false_positives - false_negatives) / total
+    return accuracies
 
 
 # Suppress warnings that might occur during type conversions, commonly with scikit-learn
 warnings.filterwarnings(action='ignore', category=DataConversionWarning)
 
 
-def train_with_cross_validation(csv_file, xml_file, model_save_dir, device, input_size, num_layers, k_folds=5):
+def remove_overlapping_windows(train_idx, val_idx, window_starts, sequence_length, num_rows):
     """
-    Trains a model using K-fold cross-validation on data specified in a CSV file and annotations in an XML file.
-    The model is saved in the specified directory if it achieves an accuracy threshold during training.
+    Removes the training windows that share a row with any validation window. Neighbouring sequences overlap by
+    up to sequence_length - 1 frames, so without this the validation frames would also be seen during training.
 
     Parameters:
-        csv_file (str): Path to the CSV file containing data.
-        xml_file (str): Path to the XML file containing annotations.
+        train_idx (np.ndarray): Indices of the training windows.
+        val_idx (np.ndarray): Indices of the validation windows.
+        window_starts (np.ndarray): The first row of every window.
+        sequence_length (int): The number of rows in each window.
+        num_rows (int): The total number of rows the windows are taken from.
+
+    Returns:
+        np.ndarray: The training window indices that do not overlap the validation windows.
+    """
+    # Mark every row covered by a validation window using a difference array
+    coverage = np.zeros(num_rows + 1, dtype=np.int64)
+    np.add.at(coverage, window_starts[val_idx], 1)
+    np.add.at(coverage, window_starts[val_idx] + sequence_length, -1)
+    covered = np.cumsum(coverage)[:-1] > 0
+    # Count the covered rows inside each training window with a prefix sum
+    covered_count = np.concatenate([[0], np.cumsum(covered)])
+    train_starts = window_starts[train_idx]
+    overlaps = covered_count[train_starts + sequence_length] - covered_count[train_starts] > 0
+    return train_idx[~overlaps]
+
+
+def train_with_cross_validation(csv_files, xml_files, model_save_dir, device, input_size, num_layers, k_folds=5,
+                                sequence_length=SEQUENCE_LENGTH):
+    """
+    Trains a model using K-fold cross-validation on the data of several CSV files and their annotation XML files.
+    The files are combined into one dataset so every batch can mix samples from all fights.
+    The model is saved in the specified directory if it achieves an accuracy threshold during training. Each
+    checkpoint stores the model architecture and sequence length next to the weights, so it can be loaded and fed
+    the same sequences it was trained on.
+
+    Parameters:
+        csv_files (list): Paths to the CSV files containing data.
+        xml_files (list): Paths to the XML files containing the annotations, in the same order as csv_files.
         model_save_dir (str): Directory where trained models will be saved.
         device (torch.device): The device (CPU or GPU) on which to perform training.
         input_size (int): The number of input features for the model.
         num_layers (int): The number of layers in the LSTM model.
         k_folds (int): The number of folds to use for K-fold cross-validation.
+        sequence_length (int): The number of consecutive frames of one person fed to the LSTM as one sequence.
     """
-    # Load the data from a CSV file
-    data = pd.read_csv(csv_file)
-    # Check if the loaded data is a pandas DataFrame
-    if not isinstance(data, pd.DataFrame):
-        raise ValueError("Data should be a pandas DataFrame.")
-
-    print(f"Data loaded successfully, DataFrame shape: {data.shape}")
-
-    # Parse annotations from the XML file
-    annotations = parse_annotations(xml_file)
-
-    # Initialize KFold object with specified number of splits, shuffling enabled and a fixed random seed for reproducibility
-    kfold = KFold(n_splits=k_folds, shuffle=True, random_state=42)
+    # Parse annotations from the XML files
+    annotations_per_file = [parse_annotations(xml_file) for xml_file in xml_files]
+
+    datasets = []
+    for csv_file, annotations in zip(csv_files, annotations_per_file):
+        # Load the data from a CSV file
+        data = pd.read_csv(csv_file, engine=CSV_ENGINE)
+        # Check if the loaded data is a pandas DataFrame
+        if not isinstance(data, pd.DataFrame):
+            raise ValueError("Data should be a pandas DataFrame.")
+
+        print(f"Data loaded successfully from {csv_file}, DataFrame shape: {data.shape}")
+        # Each file keeps its own normalization and sequences, so windows never span two fights; the normalization
+        # is refitted on the training windows of every fold below
+        datasets.append(KeypointDataset(data, annotations, sequence_length))
+
+    # Combine all files into a single dataset and keep all labels together for computing class weights
+    full_dataset = ConcatDataset(datasets)
+    all_labels = torch.cat([dataset.labels for dataset in datasets]).numpy()
+    # Index of the first window of each file in the combined dataset
+    window_offsets = [0] + full_dataset.cumulative_sizes[:-1]
+
+    # Create the model and optimizer once and move the model to the specified device
+    model = KickBoxingLSTM(input_size, HIDDEN_SIZE, num_layers).to(device)
+    # Moving the model can split the LSTM weights, so flatten them again for cuDNN
+    model.lstm.flatten_parameters()
+    optimizer = Adam(model.parameters(), lr=0.001)
+    # Compile the model on the GPU where supported, otherwise train the eager model
+    compiled_model = compile_for_training(model, input_size, device, sequence_length)
+
+    # Every fold starts from the same weights, which are reloaded in place instead of rebuilding the model
+    initial_model_state = copy.deepcopy(model.state_dict())
+    initial_optimizer_state = copy.deepcopy(optimizer.state_dict())
+
+    # Initialize KFold object with specified number of splits; without shuffling each fold validates on a contiguous
+    # stretch of video, so only the windows at its edges overlap the training data
+    kfold = KFold(n_splits=k_folds, shuffle=False)
+    # Split every file separately, so each fold validates on part of every fight and every file keeps
+    # training windows to fit its normalization on
+    file_splits = [list(kfold.split(np.arange(len(dataset)))) for dataset in datasets]
 
     # Iterate over each fold, training and validating the model
-    for fold, (train_idx, val_idx) in enumerate(kfold.split(data)):
+    for fold in range(k_folds):
         print(f"Training fold {fold + 1}/{k_folds}")
 
-        # Separate the data into training and validation datasets using the indices provided by KFold
-        train_data = data.iloc[train_idx]
-        val_data = data.iloc[val_idx]
-
-        # Initialize datasets and dataloaders for training and validation
-        train_dataset = KeypointDataset(train_data, annotations)
-        val_dataset = KeypointDataset(val_data, annotations)
-        train_loader = DataLoader(train_dataset, batch_size=10, shuffle=True)
-        val_loader = DataLoader(val_dataset, batch_size=10, shuffle=False)
+        train_parts, val_parts = [], []
+        for dataset, offset, splits in zip(datasets, window_offsets, file_splits):
+            file_train_idx, file_val_idx = splits[fold]
+            # Drop the training windows that share frames with the validation windows
+            file_train_idx = remove_overlapping_windows(file_train_idx, file_val_idx, dataset.window_starts,
+                                                        sequence_length, len(dataset.kp_tensor))
+            # Fit the file's normalization on its training windows only
+            dataset.fit_scaler(file_train_idx)
+            # Convert the file's window indices into indices of the combined dataset
+            train_parts.append(file_train_idx + offset)
+            val_parts.append(file_val_idx + offset)
+        train_idx = np.concatenate(train_parts)
+        val_idx = np.concatenate(val_parts)
 
-        # Create the model and move it to the specified device
-        model = KickBoxingLSTM(input_size, 128, num_layers).to(device)
-        optimizer = Adam(model.parameters(), lr=0.001)
-        loss_function = CrossEntropyLoss()
+        # Separate the data into training and validation datasets using the indices provided by KFold
+        train_dataset = Subset(full_dataset, train_idx)
+        val_dataset = Subset(full_dataset, val_idx)
+        # Worker processes prepare batches in the background and pinned memory allows asynchronous copies to the GPU
+        pin_memory = device.type == 'cuda'
+        train_loader = DataLoader(train_dataset, batch_size=64, shuffle=True, num_workers=4, pin_memory=pin_memory,
+                                  persistent_workers=True, prefetch_factor=4)
+        val_loader = DataLoader(val_dataset, batch_size=64, shuffle=False, num_workers=4, pin_memory=pin_memory,
+                                persistent_workers=True, prefetch_factor=2)
+
+        # Reset the model and optimizer to the starting weights so folds do not see each other's validation data
+        model.load_state_dict(initial_model_state)
+        optimizer.load_state_dict(initial_optimizer_state)
+        # Class weights only depend on the training labels, so compute them once per fold
+        class_weights = compute_class_weights(all_labels[train_idx])
+        loss_function = CrossEntropyLoss(weight=torch.from_numpy(class_weights).float().to(device))
+        # Train in mixed precision on the GPU; the scaler keeps small FP16 gradients from underflowing
+        use_amp = device.type == 'cuda'
+        scaler = torch.cuda.amp.GradScaler(enabled=use_amp)
 
         # Perform the training loop
         for epoch in range(50):  # Modify the number of epochs if needed
             model.train()  # Set the model to training mode
-            for batch in train_loader:
-                keypoints = batch['keypoints'].to(device)
-                labels = batch['labels'].to(device)
-                optimizer.zero_grad()  # Zero the gradients to prevent accumulation
-                outputs = model(keypoints)
-                loss = loss_function(outputs, labels)
-                loss.backward()  # Perform backpropagation
-                optimizer.step()  # Update model parameters
+            # Keep the running loss on the device so no step has to wait for a GPU to CPU transfer
+            total_loss = torch.zeros((), device=device)
+            # Prefetch the next batch onto the device while the current one is being trained on
+            for keypoints, labels in DataPrefetcher(train_loader, device):
+                optimizer.zero_grad(set_to_none=True)  # Reset the gradients to None instead of filling them with zeros
+                with torch.cuda.amp.autocast(enabled=use_amp):
+                    outputs = compiled_model(keypoints)
+                    loss = loss_function(outputs, labels)
+                scaler.scale(loss).backward()  # Perform backpropagation on the scaled loss
+                scaler.step(optimizer)  # Unscale the gradients and update model parameters
+                scaler.update()  # Adjust the scale for the next iteration
+                total_loss += loss.detach()
+            # Transfer the average loss back to the CPU once per epoch
+            average_loss = (total_loss / len(train_loader)).item()
 
             # Validation loop to evaluate the model
             model.eval()  # Set the model to evaluation mode
-            correct, total = 0, 0
+            correct, total = torch.zeros((), dtype=torch.long, device=device), 0
             with torch.no_grad():  # Disable gradient calculation for efficiency
                 for batch in val_loader:
-                    keypoints = batch['keypoints'].to(device)
-                    labels = batch['labels'].to(device)
-                    outputs = model(keypoints)
-                    _, predicted = torch.max(outputs.data, 1)
+                    keypoints = batch['keypoints'].to(device, non_blocking=True)
+                    labels = batch['labels'].to(device, non_blocking=True)
+                    outputs = compiled_model(keypoints)
+                    predicted = outputs.argmax(1)
                     total += labels.size(0)
-                    correct += (predicted == labels).sum().item()
-            accuracy = correct / total
-            print(f"Fold {fold + 1}, Epoch {epoch + 1}: Validation Accuracy = {accuracy:.4f}")
+                    correct += (predicted == labels).sum()
+            accuracy = correct.item() / total
+            print(f"Fold {fold + 1}, Epoch {epoch + 1}: Training Loss = {average_loss:.4f}, "
+                  f"Validation Accuracy = {accuracy:.4f}")
 
             # Save the model if it meets a specified accuracy threshold
             if accuracy > 0.90:
                 model_path = os.path.join(model_save_dir, f'model_fold_{fold + 1}_epoch_{epoch + 1}.pth')
-                torch.save(model.state_dict(), model_path)
+                torch.save({'state_dict': model.state_dict(), 'input_size': input_size, 'hidden_size': HIDDEN_SIZE,
+                            'num_layers': num_layers, 'sequence_length': sequence_length}, model_path)
                 print(f"Model saved for fold {fold + 1}, epoch {epoch + 1}.")
 
     print("Training completed for all folds.")  # Indicate the end of the cross-validation training
@@ -479,46 +872,34 @@ def validate_by_strike_type(loader, model, device):
     # Set the model to evaluation mode to turn off dropout, batch normalization etc. during validation
     model.eval()
 
-    # Lists to store predictions and labels for later analysis
-    all_preds, all_labels = [], []
+    # Confusion matrix accumulated on the device; rows are actual labels and columns are predictions
+    conf_matrix = torch.zeros(NUM_CLASSES, NUM_CLASSES, dtype=torch.long, device=device)
 
     # Disable gradient calculations for validation to save memory and computations
-    with torch.no_grad():
+    with torch.inference_mode():
         for data in loader:
             # Transfer the keypoints and labels to the specified device (e.g., GPU)
-            keypoints = data['keypoints'].to(device)
-            labels = data['labels'].to(device)
+            keypoints = data['keypoints'].to(device, non_blocking=True)
+            labels = data['labels'].to(device, non_blocking=True)
 
             # Perform model inference to get outputs
             outputs = model(keypoints)
             # Determine the predicted class by finding the index with the highest score in the output logits
-            _, preds = torch.max(outputs, 1)
+            preds = outputs.argmax(1)
 
-            # Collect all predictions and actual labels
-            all_preds.extend(preds.cpu().numpy())
-            all_labels.extend(labels.cpu().numpy())
+            # Add the batch to the confusion matrix without transferring anything back to the CPU
+            conf_matrix += batch_confusion_matrix(labels, preds)
 
-    # Dictionary to store the accuracy for each strike type
-    accuracies = {}
-
-    # Calculate accuracy for each strike type
-    for idx, strike in enumerate(STRIKE_TYPES):
-        # Create boolean arrays indicating where the specific strike type is the true label or the prediction
-        specific_labels = (np.array(all_labels) == idx)
-        specific_preds = (np.array(all_preds) == idx)
-
-        # Only calculate accuracy if there are instances of this strike type in the true labels
-        if specific_labels.sum() > 0:
-            accuracies[strike] = accuracy_score(specific_labels, specific_preds)
-
-    # Return the dictionary containing accuracies for each strike type
-    return accuracies
+    # Transfer the confusion matrix back to the CPU once and compute the accuracy for each strike type from it
+    return per_strike_accuracies(conf_matrix.cpu())
 
 
 def compute_class_weights(labels):
     """
     Computes class weights inversely proportional to the frequency of each class in the given labels.
     This method is useful for training on imbalanced datasets, as it allows minority classes to have a greater influence on the model.
+    The weights follow scikit-learn's 'balanced' formula, n_samples / (n_classes * count), which keeps rare classes
+    from receiving the extreme weights that a plain 1 / count would give them.
 
     Parameters:
         labels (array-like): An array of integer class labels.
@@ -526,13 +907,14 @@ def compute_class_weights(labels):
     Returns:
         np.ndarray: An array containing the computed weights for each class.
     """
+    labels = np.asarray(labels)
     # Count the number of occurrences of each class in the dataset
     label_counts = np.bincount(labels, minlength=NUM_CLASSES)
 
-    # Compute the inverse of each count to determine class weights
-    class_weights = 1. / label_counts
+    # Compute the balanced inverse frequency of each class to determine class weights
+    class_weights = labels.size / (NUM_CLASSES * label_counts.clip(min=1))
 
-    # If a class does not appear in the dataset (count is zero), set its weight to zero to avoid division by zero
+    # If a class does not appear in the dataset (count is zero), set its weight to zero
     class_weights[label_counts == 0] = 0
 
     # Return the computed class weights
@@ -552,27 +934,24 @@ def compare_with_validation_data(validation_csv, predictions, model_save_dir, ep
 
     """
     # Load validation data from the specified CSV file
-    validation_data = pd.read_csv(validation_csv)
+    validation_data = pd.read_csv(validation_csv, engine=CSV_ENGINE)
 
     # Construct the path for the new CSV file that will store the comparison results
     prediction_file_path = os.path.join(model_save_dir, f"validation_comparison_epoch_{epoch}.csv")
 
-    # Open the file for writing and create a CSV writer object
-    with open(prediction_file_path, 'w', newline='') as file:
+    # Only predictions with a corresponding row in the validation data are written
+    num_rows = min(len(predictions), len(validation_data))
+    frame_numbers = validation_data['Frame Number'].to_numpy()[:num_rows]
+    actual_strikes = validation_data['Actual Strike'].to_numpy()[:num_rows]
+    # Map the numerical predictions back to the corresponding strike types
+    predicted_strikes = [STRIKE_TYPES[pred] for pred in predictions[:num_rows]]
+
+    # Open the file for writing with a large buffer and write all comparison rows at once
+    with open(prediction_file_path, 'w', newline='', buffering=CSV_WRITE_BUFFER_SIZE) as file:
         writer = csv.writer(file)
         # Write the header row
         writer.writerow(['Frame Number', 'Model Prediction', 'Actual Strike'])
-
-        # Iterate over the predictions and the corresponding rows in the validation dataset
-        for i, pred in enumerate(predictions):
-            # Ensure there is a corresponding row in the validation data for each prediction
-            if i < len(validation_data):
-                frame_number = validation_data.iloc[i]['Frame Number']
-                actual_strike = validation_data.iloc[i]['Actual Strike']
-                # Map the numerical prediction back to the corresponding strike type
-                predicted_strike = STRIKE_TYPES[pred]
-                # Write the comparison data to the CSV
-                writer.writerow([frame_number, predicted_strike, actual_strike])
+        writer.writerows(zip(frame_numbers, predicted_strikes, actual_strikes))
 
 
 def make_predictions(model, loader, device):
@@ -592,27 +971,31 @@ def make_predictions(model, loader, device):
     # Set the model to evaluation mode to deactivate dropout and other training-specific behaviors
     model.eval()
 
-    # List to store the predictions
-    predictions = []
+    # Preallocated buffer on the device holding the predictions for every sample in the loader
+    predictions = torch.empty(len(loader.dataset), dtype=torch.long, device=device)
+    # Position in the buffer where the next batch of predictions is written
+    offset = 0
 
     # Disable gradient calculations as they are not needed for inference, which saves memory and computations
-    with torch.no_grad():
+    with torch.inference_mode():
         for data in loader:
             # Move the keypoints data to the specified device (e.g., GPU)
-            keypoints = data['keypoints'].to(device)
+            keypoints = data['keypoints'].to(device, non_blocking=True)
 
             # Perform the forward pass to get outputs from the model
             outputs = model(keypoints)
 
             # Extract the indices of the maximum values along the predicted output, which represent the class
             # predictions
-            _, preds = torch.max(outputs, 1)
+            preds = outputs.argmax(1)
 
-            # Append the predictions to the list after moving them back to the CPU and converting to numpy array
-            predictions.extend(preds.cpu().numpy())
+            # Write the predictions into the buffer without transferring them back to the CPU
+            batch_size = preds.size(0)
+            predictions[offset:offset + batch_size] = preds
+            offset += batch_size
 
-    # Return the list of predictions
-    return predictions
+    # Move the predictions for the samples that were seen back to the CPU at once and return them as a list
+    return predictions[:offset].cpu().tolist()
 
 def save_predictions_to_file(loader, predictions, filepath):
     """
@@ -630,21 +1013,18 @@ def save_predictions_to_file(loader, predictions, filepath):
         - The frame number is assumed to be sequential and starting from zero, corresponding to the order of the samples
           in the DataLoader. If frame numbers need to be extracted differently, the function may require adjustments.
     """
-    # Open the file at the specified path with write permissions and ensure it handles new lines appropriately for CSV
-    with open(filepath, mode='w', newline='') as file:
+    # Frame number is assumed to be sequential starting at 0; modify if actual frame numbers are available.
+    # Each prediction index is converted to the corresponding strike type using a predefined list
+    rows = [(frame_number, STRIKE_TYPES[pred]) for frame_number, pred in enumerate(predictions)]
+
+    # Open the file at the specified path with a large write buffer and ensure it handles new lines appropriately for CSV
+    with open(filepath, mode='w', newline='', buffering=CSV_WRITE_BUFFER_SIZE) as file:
         # Create a CSV writer object
         writer = csv.writer(file)
         # Write the header row to the CSV file
         writer.writerow(['Frame Number', 'Predicted Strike'])
-
-        # Iterate through each prediction and its corresponding index
-        for i, pred in enumerate(predictions):
-            # Frame number is assumed to be sequential starting at 0; modify if actual frame numbers are available
-            frame_number = i
-            # Convert the prediction index to the corresponding strike type using a predefined list or dictionary
-            predicted_strike = STRIKE_TYPES[pred]
-            # Write the frame number and predicted strike to the file
-            writer.writerow([frame_number, predicted_strike])
+        # Write all rows in a single call
+        writer.writerows(rows)
 
 
 def compare_predictions(validation_data, predictions, filepath):
@@ -665,22 +1045,19 @@ def compare_predictions(validation_data, predictions, filepath):
         - Predictions are converted from indices to more descriptive names using a predefined list or dictionary,
           `STRIKE_TYPES`.
     """
+    # Build the frame number, predicted strike, and actual strike rows, converting each numeric prediction into
+    # a more meaningful strike type using the `STRIKE_TYPES` list
+    rows = [(data['frame_number'], STRIKE_TYPES[pred], data['actual_strike'])
+            for data, pred in zip(validation_data, predictions)]
+
     # Open the specified file for writing; ensure newline behavior is handled correctly for different environments
-    with open(filepath, 'w', newline='') as file:
+    with open(filepath, 'w', newline='', buffering=CSV_WRITE_BUFFER_SIZE) as file:
         # Create a CSV writer object to handle the writing of rows
         writer = csv.writer(file)
         # Write the header of the CSV file to define the columns
         writer.writerow(['Frame Number', 'Predicted Strike', 'Actual Strike'])
-
-        # Loop through each set of validation data and corresponding prediction
-        for data, pred in zip(validation_data, predictions):
-            # Extract the frame number and actual strike information from the validation data
-            frame_number = data['frame_number']
-            actual_strike = data['actual_strike']
-            # Convert the numeric prediction into a more meaningful strike type using the `STRIKE_TYPES` dictionary
-            predicted_strike = STRIKE_TYPES[pred]
-            # Write the frame number, predicted strike, and actual strike to the CSV file
-            writer.writerow([frame_number, predicted_strike, actual_strike])
+        # Write all rows in a single call
+        writer.writerows(rows)
 
 
 # Function to write validation results to CSV file
@@ -700,47 +1077,53 @@ def write_validation_results(loader, model, device, filepath):
     Notes:
         - The 'keypoints' from each batch in the loader are used as input to the model.
         - The 'actual_strike' values are expected to be in the same batch dictionary as the 'keypoints'.
-        - Predictions are mapped from numerical IDs back to strike names using an inverse dictionary
-          (`STRIKE_TYPE_TO_ID.inverse`), which should be predefined.
+        - Predictions are mapped from numerical IDs back to strike names using `STRIKE_TYPES`, which is ordered by ID.
         - Frame numbers are assumed to start from 0 and increment for each sample processed.
     """
     # Set the model to evaluation mode, which deactivates dropout and other training-specific layers
     model.eval()
 
+    # Rows of frame number, predicted strike, and actual strike, written to the file once inference is done
+    rows = []
+
+    # Initialize the frame number counter
+    frame_number = 0
+
+    # Disable gradient computations for more efficient memory use during inference
+    with torch.inference_mode():
+        # Iterate over each batch provided by the DataLoader
+        for data in loader:
+            # Move the keypoints data to the specified computing device
+            keypoints = data['keypoints'].to(device, non_blocking=True)
+            # Get model outputs (logits) for the keypoints
+            outputs = model(keypoints)
+            # Determine the predicted labels by finding the max logit for each example
+            predicted_labels = outputs.argmax(1)
+
+            # Move the whole batch of predictions to the CPU at once instead of one element at a time
+            predicted_ids = predicted_labels.cpu().tolist()
+
+            # Iterate over each actual label and its corresponding predicted label in the batch
+            for actual, pred in zip(data['actual_strike'], predicted_ids):
+                # Map the predicted label index back to a strike name; STRIKE_TYPES is ordered by ID
+                rows.append((frame_number, STRIKE_TYPES[pred], actual))
+                # Increment the frame number for each sample processed
+                frame_number += 1
+
     # Open the file with the specified path and ensure newline characters are handled correctly
-    with open(filepath, 'w', newline='') as file:
+    with open(filepath, 'w', newline='', buffering=CSV_WRITE_BUFFER_SIZE) as file:
         # Create a CSV writer to write to the file
         writer = csv.writer(file)
-        # Write the header row to the CSV file
+        # Write the header row and all collected rows to the CSV file
         writer.writerow(['Frame Number', 'Predicted Strike', 'Actual Strike'])
-
-        # Initialize the frame number counter
-        frame_number = 0
-
-        # Disable gradient computations for more efficient memory use during inference
-        with torch.no_grad():
-            # Iterate over each batch provided by the DataLoader
-            for data in loader:
-                # Move the keypoints data to the specified computing device
-                keypoints = data['keypoints'].to(device)
-                # Get model outputs (logits) for the keypoints
-                outputs = model(keypoints)
-                # Determine the predicted labels by finding the max logit for each example
-                _, predicted_labels = torch.max(outputs, 1)
-
-                # Iterate over each actual label and its corresponding predicted label in the batch
-                for actual, pred in zip(data['actual_strike'], predicted_labels):
-                    # Map the predicted label index back to a strike name using an inverse dictionary
-                    predicted_strike = STRIKE_TYPE_TO_ID.inverse[pred.item()]
-                    # Write the frame number, predicted strike, and actual strike to the CSV
-                    writer.writerow([frame_number, predicted_strike, actual])
-                    # Increment the frame number for each sample processed
-                    frame_number += 1
+        writer.writerows(rows)
 
 
 # Main Function
 if __name__ == '__main__':
     device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
+    # Input shapes are fixed, so let cuDNN benchmark and pick the fastest kernels
+    torch.backends.cudnn.benchmark = True
     input_size = 51  # Number of input features (e.g., number of keypoints * coordinates)
     num_layers = 2  # Number of LSTM layers
     num_classes = 8  # Number of classes (number of different strike types)
@@ -771,7 +1154,6 @@ if __name__ == '__main__':
         'C:/Users/12.99 a pillow/PycharmProjects/CS482FinalProject/Validation/RodtangvGoncalvesValidation.csv'
     ]
 
-    # Call the training function with all necessary parameters
-    for csv_file, xml_file in zip(csv_files, xml_files):
-        print(f"Starting training for {csv_file} using annotations from {xml_file}")
-        train_with_cross_validation(csv_file, xml_file, model_save_dir, device, input_size, num_layers)
+    # Train a single model on all files combined
+    train_with_cross_validation(csv_files, xml_files, model_save_dir, device, input_size, num_layers,
+                                sequence_length=SEQUENCE_LENGTH)